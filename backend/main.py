@@ -1,18 +1,62 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, Response
+from fastapi.responses import FileResponse, HTMLResponse, Response
 import httpx
 import asyncio
+from collections import OrderedDict
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
 import re
 import os
+import hashlib
+import json
+import mmap
+import struct
+import tempfile
+import time
+import zipfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = FastAPI(title="Hello Net Browser Backend", version="1.0.0")
 
+# Offline page snapshots (see /snapshots endpoints)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+SNAPSHOT_MAX_RESOURCES = int(os.getenv("SNAPSHOT_MAX_RESOURCES", "100"))
+SNAPSHOT_MAX_RESOURCE_BYTES = int(os.getenv("SNAPSHOT_MAX_RESOURCE_BYTES", str(10 * 1024 * 1024)))
+SNAPSHOT_MAX_ARCHIVE_BYTES = int(os.getenv("SNAPSHOT_MAX_ARCHIVE_BYTES", str(100 * 1024 * 1024)))
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "64"))
+SNAPSHOT_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+SNAPSHOT_ENTRY_RE = re.compile(r"^(index\.json|index\.html|r/\d+)$")
+
+# Content types a snapshot subresource may be served with; anything else is
+# served as application/octet-stream
+SNAPSHOT_CONTENT_TYPES = {
+    "text/css",
+    "application/font-woff",
+    "application/font-woff2",
+    "application/x-font-woff",
+    "application/x-font-ttf",
+    "application/font-sfnt",
+    "application/vnd.ms-fontobject",
+}
+SNAPSHOT_CONTENT_TYPE_PREFIXES = ("image/", "font/")
+
+# Snapshots are static; never let archived markup run scripts
+SNAPSHOT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Content-Security-Policy": "script-src 'none'; object-src 'none'",
+    "X-Content-Type-Options": "nosniff",
+}
+
+# A srcset candidate's URL: a run of non-whitespace, minus any trailing commas
+SRCSET_URL_RE = re.compile(r'[\s,]*(\S+?)(,*)(?=\s|$)')
+
+# url(...) references and @import "..." rules in CSS
+CSS_URL_RE = re.compile(r'''(@import\s+)?url\(\s*(['"]?)([^'")]*)\2\s*\)|@import\s+(['"])([^'"]*)\4''', re.IGNORECASE)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -37,13 +81,23 @@ async def get_http_client():
         follow_redirects=True
     )
 
+def strip_unsafe_elements(soup: BeautifulSoup):
+    """Remove scripts and embedded content from a parsed page"""
+    for tag in soup.find_all(['script', 'noscript', 'iframe', 'embed', 'object']):
+        tag.decompose()
+
+def document_base_url(soup: BeautifulSoup, page_url: str) -> str:
+    """Return the URL relative references resolve against, honoring <base href>"""
+    if soup.base and soup.base.get('href'):
+        return urljoin(page_url, soup.base['href'])
+    return page_url
+
 def clean_html_for_mobile(html_content: str, base_url: str) -> str:
     """Clean and optimize HTML for mobile viewing"""
     soup = BeautifulSoup(html_content, 'html.parser')
     
     # Remove problematic elements
-    for tag in soup.find_all(['script', 'noscript', 'iframe', 'embed', 'object']):
-        tag.decompose()
+    strip_unsafe_elements(soup)
     
     # Add mobile viewport if not present
     if not soup.find('meta', attrs={'name': 'viewport'}):
@@ -87,6 +141,7 @@ def clean_html_for_mobile(html_content: str, base_url: str) -> str:
         soup.head.append(mobile_css)
     
     # Fix relative URLs
+    base_url = document_base_url(soup, base_url)
     for tag in soup.find_all(['a', 'img', 'link', 'script']):
         for attr in ['href', 'src']:
             if tag.get(attr):
@@ -140,6 +195,370 @@ def extract_text_content(html_content: str) -> dict:
         "length": len(main_content)
     }
 
+def snapshot_path(name: str) -> str:
+    """Return the archive path for a snapshot name, rejecting unsafe names"""
+    if not SNAPSHOT_NAME_RE.match(name):
+        raise HTTPException(status_code=400, detail="Invalid snapshot name")
+    return os.path.join(SNAPSHOT_DIR, f"{name}.zip")
+
+def snapshot_name_for_url(url: str) -> str:
+    """Derive a filesystem-safe snapshot name from a URL.
+
+    The slug keeps names readable; the hash of the full URL (query string
+    included) keeps distinct pages from sharing a name.
+    """
+    parsed_url = urlparse(url)
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '-', f"{parsed_url.netloc}{parsed_url.path}").strip('-')
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]
+    return f"{slug[:80] or 'snapshot'}-{digest}"
+
+def snapshot_content_type(content_type: str) -> str:
+    """Reduce a content type to one that is safe to serve from a snapshot"""
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type in SNAPSHOT_CONTENT_TYPES or media_type.startswith(SNAPSHOT_CONTENT_TYPE_PREFIXES):
+        return media_type
+    return "application/octet-stream"
+
+def validate_snapshot_index(index) -> None:
+    """Check the shape of a snapshot's index.json"""
+    if not isinstance(index, dict):
+        raise ValueError("index.json must be an object")
+    resources = index.get("resources", {})
+    if not isinstance(resources, dict) or not all(isinstance(meta, dict) for meta in resources.values()):
+        raise ValueError("index.json resources must be an object of objects")
+
+def rewrite_css_urls(css: str, base_url: str, replace) -> str:
+    """Rewrite url(...) and @import references in CSS.
+
+    ``replace(absolute_url, is_css)`` returns the new reference. Inline
+    data and non-http references are left untouched.
+    """
+    def substitute(match):
+        if match.group(4) is not None:
+            quote, reference, is_css = match.group(4), match.group(5), True
+        else:
+            quote, reference, is_css = match.group(2), match.group(3), bool(match.group(1))
+
+        reference = reference.strip()
+        if not reference or reference.startswith(('data:', '#')):
+            return match.group(0)
+        absolute_url = urljoin(base_url, reference)
+        if urlparse(absolute_url).scheme not in ('http', 'https'):
+            return match.group(0)
+
+        new_reference = replace(absolute_url, is_css)
+        if match.group(4) is not None:
+            return f"@import {quote}{new_reference}{quote}"
+        return f"{match.group(1) or ''}url({quote}{new_reference}{quote})"
+
+    return CSS_URL_RE.sub(substitute, css)
+
+def parse_srcset(srcset: str) -> list:
+    """Split a srcset attribute into (url, descriptor) candidates.
+
+    Follows the HTML parsing rules, so commas inside data: URLs do not
+    split a candidate.
+    """
+    candidates = []
+    position = 0
+    while True:
+        match = SRCSET_URL_RE.match(srcset, position)
+        if not match:
+            return candidates
+        position = match.end()
+        descriptor = ''
+        if not match.group(2):
+            end = srcset.find(',', position)
+            end = len(srcset) if end == -1 else end
+            descriptor = srcset[position:end].strip()
+            position = end
+        candidates.append((match.group(1), descriptor))
+
+def rewrite_html_references(soup: BeautifulSoup, base_url: str, replace):
+    """Rewrite the subresource references of a page that a snapshot archives.
+
+    Covers images (including srcset candidates), stylesheets, icons,
+    <style> blocks and inline style attributes. ``replace`` is called as
+    in rewrite_css_urls.
+    """
+    def replace_reference(reference: str, is_css: bool) -> str:
+        absolute_url = urljoin(base_url, reference.strip())
+        if urlparse(absolute_url).scheme not in ('http', 'https'):
+            return reference
+        return replace(absolute_url, is_css)
+
+    for tag in soup.find_all('img', src=True):
+        tag['src'] = replace_reference(tag['src'], False)
+
+    for tag in soup.find_all(['img', 'source'], srcset=True):
+        tag['srcset'] = ', '.join(
+            f"{replace_reference(candidate_url, False)} {descriptor}".strip()
+            for candidate_url, descriptor in parse_srcset(tag['srcset'])
+        )
+
+    for tag in soup.find_all('link', href=True):
+        rel = tag.get('rel') or []
+        if 'stylesheet' in rel:
+            tag['href'] = replace_reference(tag['href'], True)
+        elif 'icon' in rel:
+            tag['href'] = replace_reference(tag['href'], False)
+
+    for tag in soup.find_all('style'):
+        if tag.string:
+            tag.string = rewrite_css_urls(tag.string, base_url, replace)
+
+    for tag in soup.find_all(style=True):
+        tag['style'] = rewrite_css_urls(tag['style'], base_url, replace)
+
+def build_snapshot_archive(archive_file, index: dict, entries: dict):
+    """Pack a snapshot into an uncompressed zip written to ``archive_file``.
+
+    Entries are stored (not deflated) so they can be served directly
+    from an mmap of the archive without decompression.
+    """
+    with zipfile.ZipFile(archive_file, 'w', compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr('index.json', json.dumps(index, indent=2))
+        for path, data in entries.items():
+            archive.writestr(path, data)
+
+def write_snapshot(name: str, index: dict, entries: dict, overwrite: bool = False) -> int:
+    """Atomically write a snapshot archive to disk and return its size.
+
+    This blocks on disk I/O; handlers run it in the threadpool and then
+    call evict_snapshot themselves.
+    """
+    path = snapshot_path(name)
+    if not overwrite and os.path.exists(path):
+        raise HTTPException(status_code=409, detail=f"Snapshot '{name}' already exists")
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            build_snapshot_archive(tmp_file, index, entries)
+            size = tmp_file.tell()
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return size
+
+async def export_snapshot(url: str) -> tuple:
+    """Fetch a page through the proxy pipeline and bundle it with its subresources"""
+    async with await get_http_client() as client:
+        response = await client.get(url)
+        response.raise_for_status()
+
+        content_type = response.headers.get('content-type', '').lower()
+        if 'text/html' not in content_type:
+            raise HTTPException(status_code=415, detail=f"Cannot snapshot {content_type} content")
+
+        # Same cleaning as /proxy, so scripts are already gone
+        soup = BeautifulSoup(clean_html_for_mobile(response.text, url), 'html.parser')
+        base_url = document_base_url(soup, url)
+
+        seen = set()
+        pending = []
+
+        def collect(resource_url: str, is_css: bool) -> str:
+            if resource_url not in seen:
+                seen.add(resource_url)
+                pending.append((resource_url, is_css))
+            return resource_url
+
+        async def fetch_resource(resource_url: str):
+            try:
+                async with client.stream('GET', resource_url) as resource_response:
+                    resource_response.raise_for_status()
+                    if int(resource_response.headers.get('content-length') or 0) > SNAPSHOT_MAX_RESOURCE_BYTES:
+                        return None
+                    body = bytearray()
+                    async for chunk in resource_response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > SNAPSHOT_MAX_RESOURCE_BYTES:
+                            return None
+                    return resource_response.headers.get('content-type', ''), bytes(body)
+            except (httpx.HTTPError, httpx.InvalidURL, ValueError):
+                return None
+
+        rewrite_html_references(soup, base_url, collect)
+
+        # Fetch breadth-first: stylesheets pull in fonts, images and @imports
+        fetched = {}
+        total_size = 0
+        attempts = 0
+        while pending and attempts < SNAPSHOT_MAX_RESOURCES:
+            batch = pending[:SNAPSHOT_MAX_RESOURCES - attempts]
+            pending = []
+            attempts += len(batch)
+            results = await asyncio.gather(*(fetch_resource(u) for u, _ in batch))
+
+            for (resource_url, is_css), result in zip(batch, results):
+                if result is None or total_size + len(result[1]) > SNAPSHOT_MAX_ARCHIVE_BYTES:
+                    continue
+                resource_type, body = result
+                total_size += len(body)
+                fetched[resource_url] = (
+                    "text/css" if is_css else snapshot_content_type(resource_type),
+                    body,
+                    is_css,
+                )
+                if is_css:
+                    # latin-1 maps bytes 1:1, so the stylesheet's encoding survives
+                    rewrite_css_urls(body.decode('latin-1'), resource_url, collect)
+
+    local_paths = {resource_url: f"r/{i}" for i, resource_url in enumerate(fetched)}
+
+    def from_page(resource_url: str, is_css: bool) -> str:
+        return local_paths.get(resource_url, resource_url)
+
+    def from_stylesheet(resource_url: str, is_css: bool) -> str:
+        # Stylesheets live next to the other entries under r/
+        path = local_paths.get(resource_url)
+        return path[len('r/'):] if path else resource_url
+
+    entries = {}
+    resources = {}
+    for resource_url, (resource_type, body, is_css) in fetched.items():
+        path = local_paths[resource_url]
+        if is_css:
+            body = rewrite_css_urls(body.decode('latin-1'), resource_url, from_stylesheet).encode('latin-1')
+        entries[path] = body
+        resources[path] = {"url": resource_url, "content_type": resource_type}
+
+    rewrite_html_references(soup, base_url, from_page)
+    # r/<n> references must resolve against /snapshots/<name>/, not upstream
+    for tag in soup.find_all('base'):
+        tag.decompose()
+    entries["index.html"] = str(soup).encode('utf-8')
+    resources["index.html"] = {"url": url, "content_type": "text/html; charset=utf-8"}
+
+    index = {
+        "version": 1,
+        "url": url,
+        "created": int(time.time()),
+        "resources": resources,
+    }
+    return index, entries
+
+def read_snapshot_archive(archive_file) -> tuple:
+    """Unpack and sanitize an uploaded snapshot archive.
+
+    Enforces the size limits, strips the same elements the mobile cleaner
+    does and restricts content types, so an imported snapshot can serve
+    nothing an exported one could not. Blocking; run it in the threadpool.
+    """
+    try:
+        with zipfile.ZipFile(archive_file) as archive:
+            infos = archive.infolist()
+            if len(infos) > SNAPSHOT_MAX_RESOURCES + 2:
+                raise ValueError("too many entries")
+            if sum(info.file_size for info in infos) > SNAPSHOT_MAX_ARCHIVE_BYTES:
+                raise ValueError("uncompressed size exceeds limit")
+            for info in infos:
+                if not SNAPSHOT_ENTRY_RE.match(info.filename):
+                    raise ValueError(f"unexpected entry {info.filename}")
+
+            index = json.loads(archive.read('index.json'))
+            validate_snapshot_index(index)
+            entries = {
+                info.filename: archive.read(info)
+                for info in infos
+                if info.filename != 'index.json'
+            }
+    except (zipfile.BadZipFile, ValueError, KeyError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot archive: {str(e)}")
+
+    if 'index.html' not in entries:
+        raise HTTPException(status_code=400, detail="Invalid snapshot archive: missing index.html")
+
+    # The mobile CSS is already in place from export; only re-strip, and drop
+    # <base> so r/<n> references stay relative to /snapshots/<name>/
+    soup = BeautifulSoup(entries['index.html'].decode('utf-8', errors='replace'), 'html.parser')
+    strip_unsafe_elements(soup)
+    for tag in soup.find_all('base'):
+        tag.decompose()
+    entries['index.html'] = str(soup).encode('utf-8')
+
+    url = index.get("url") if isinstance(index.get("url"), str) else None
+    resources = {"index.html": {"url": url, "content_type": "text/html; charset=utf-8"}}
+    for path in entries:
+        if path == 'index.html':
+            continue
+        meta = index.get("resources", {}).get(path, {})
+        resources[path] = {
+            "url": meta.get("url") if isinstance(meta.get("url"), str) else None,
+            "content_type": snapshot_content_type(meta.get("content_type")),
+        }
+
+    index = {
+        "version": 1,
+        "url": url,
+        "created": index.get("created") if isinstance(index.get("created"), int) else int(time.time()),
+        "resources": resources,
+    }
+    return index, entries
+
+# Open snapshot archives, least recently used first:
+# name -> {"mmap", "stat": (st_ino, st_mtime_ns, st_size), "entries": {path: (offset, size, content_type)}, "index"}
+_snapshot_cache = OrderedDict()
+
+def evict_snapshot(name: str):
+    """Drop a snapshot from the cache and release its mapping"""
+    cached = _snapshot_cache.pop(name, None)
+    if cached:
+        cached["mmap"].close()
+
+def load_snapshot(name: str) -> dict:
+    """Map a snapshot archive into memory and locate each stored entry"""
+    path = snapshot_path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        evict_snapshot(name)
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    # The file may have been replaced by another worker or copied in by hand
+    cached = _snapshot_cache.get(name)
+    if cached and cached["stat"] == file_id:
+        _snapshot_cache.move_to_end(name)
+        return cached
+    evict_snapshot(name)
+
+    mapped = None
+    try:
+        # Read the zip directory from the file; entries are served from the mapping
+        with open(path, 'rb') as archive_file, zipfile.ZipFile(archive_file) as archive:
+            mapped = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+            index = json.loads(archive.read('index.json'))
+            validate_snapshot_index(index)
+            resources = index.get("resources", {})
+            entries = {}
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{info.filename} is compressed")
+                # Local file header: 30 fixed bytes, then file name and extra field
+                name_length, extra_length = struct.unpack(
+                    '<HH', mapped[info.header_offset + 26:info.header_offset + 30]
+                )
+                offset = info.header_offset + 30 + name_length + extra_length
+                if info.filename == 'index.html':
+                    content_type = "text/html; charset=utf-8"
+                else:
+                    content_type = snapshot_content_type(resources.get(info.filename, {}).get("content_type"))
+                entries[info.filename] = (offset, info.file_size, content_type)
+    except Exception as e:
+        if mapped is not None:
+            mapped.close()
+        raise HTTPException(status_code=500, detail=f"Corrupt snapshot: {str(e)}")
+
+    loaded = {"mmap": mapped, "stat": file_id, "entries": entries, "index": index}
+    _snapshot_cache[name] = loaded
+    while len(_snapshot_cache) > SNAPSHOT_CACHE_SIZE:
+        evict_snapshot(next(iter(_snapshot_cache)))
+    return loaded
+
 @app.get("/")
 async def root():
     return {"message": "Hello Net Browser Backend", "status": "running"}
@@ -218,6 +637,112 @@ async def extract_content(url: str = Query(..., description="URL to extract cont
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/snapshots/export")
+async def create_snapshot(
+    url: str = Query(..., description="URL to snapshot"),
+    name: str = Query(None, description="Snapshot name (derived from the URL if omitted)"),
+    overwrite: bool = Query(False, description="Replace an existing snapshot with the same name"),
+):
+    """Snapshot a proxied page and its subresources into an offline archive"""
+    try:
+        # Validate URL
+        parsed_url = urlparse(url)
+        if not parsed_url.scheme:
+            url = f"https://{url}"
+
+        name = name or snapshot_name_for_url(url)
+        if not overwrite and os.path.exists(snapshot_path(name)):
+            raise HTTPException(status_code=409, detail=f"Snapshot '{name}' already exists")
+
+        index, entries = await export_snapshot(url)
+        size = await run_in_threadpool(write_snapshot, name, index, entries, overwrite)
+        evict_snapshot(name)
+
+        return {
+            "name": name,
+            "url": url,
+            "resources": len(entries),
+            "size": size,
+            "path": f"/snapshots/{name}/index.html",
+            "status": "success"
+        }
+
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"HTTP error: {e}")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Request error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@app.post("/snapshots/import")
+async def import_snapshot(
+    file: UploadFile = File(..., description="Snapshot archive"),
+    name: str = Query(None, description="Snapshot name (defaults to the uploaded file name)"),
+    overwrite: bool = Query(False, description="Replace an existing snapshot with the same name"),
+):
+    """Import a snapshot archive, e.g. one downloaded from another instance"""
+    name = name or os.path.splitext(os.path.basename(file.filename or ""))[0]
+    if not overwrite and os.path.exists(snapshot_path(name)):
+        raise HTTPException(status_code=409, detail=f"Snapshot '{name}' already exists")
+
+    # The upload is already spooled to a temporary file; read it from there
+    file.file.seek(0, os.SEEK_END)
+    if file.file.tell() > SNAPSHOT_MAX_ARCHIVE_BYTES:
+        raise HTTPException(status_code=413, detail="Snapshot archive too large")
+    file.file.seek(0)
+
+    index, entries = await run_in_threadpool(read_snapshot_archive, file.file)
+
+    # Re-pack so every entry is stored uncompressed and can be served from mmap
+    await run_in_threadpool(write_snapshot, name, index, entries, overwrite)
+    evict_snapshot(name)
+
+    return {
+        "name": name,
+        "url": index.get("url"),
+        "resources": len(entries),
+        "path": f"/snapshots/{name}/index.html",
+        "status": "success"
+    }
+
+@app.get("/snapshots")
+async def list_snapshots():
+    """List snapshots available on disk"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return {"snapshots": []}
+    names = sorted(
+        filename[:-len('.zip')]
+        for filename in os.listdir(SNAPSHOT_DIR)
+        if filename.endswith('.zip') and SNAPSHOT_NAME_RE.match(filename[:-len('.zip')])
+    )
+    return {"snapshots": names}
+
+@app.get("/snapshots/{name}/archive")
+async def download_snapshot(name: str):
+    """Download the raw snapshot archive"""
+    path = snapshot_path(name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return FileResponse(path, media_type="application/zip", filename=f"{name}.zip")
+
+@app.get("/snapshots/{name}/{path:path}")
+async def serve_snapshot(name: str, path: str):
+    """Serve a page or subresource from a snapshot without touching the network"""
+    snapshot = load_snapshot(name)
+    entry = snapshot["entries"].get(path or "index.html")
+    if not entry or path == 'index.json':
+        raise HTTPException(status_code=404, detail="Not found in snapshot")
+
+    offset, size, content_type = entry
+    # Set Content-Type directly so Starlette does not append a charset to
+    # archived stylesheets, whose bytes are kept in their original encoding
+    return Response(
+        content=snapshot["mmap"][offset:offset + size],
+        headers={**SNAPSHOT_HEADERS, "Content-Type": content_type}
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
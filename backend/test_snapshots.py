@@ -0,0 +1,255 @@
+import io
+import json
+import os
+import zipfile
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_DIR", str(tmp_path))
+    yield tmp_path
+    for name in list(main._snapshot_cache):
+        main.evict_snapshot(name)
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def make_snapshot(snapshot_dir, name, entries, resources=None):
+    index = {"version": 1, "url": "https://example.com/", "resources": resources or {}}
+    with open(os.path.join(snapshot_dir, f"{name}.zip"), 'wb') as archive_file:
+        main.build_snapshot_archive(archive_file, index, entries)
+
+
+def make_upload(files, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as archive:
+        for path, data in files.items():
+            archive.writestr(path, data)
+    return buffer.getvalue()
+
+
+def test_serve_snapshot_entries(snapshot_dir, client):
+    make_snapshot(snapshot_dir, "page", {
+        "index.html": b"<p>hello</p>",
+        "r/0": b"\x89PNG data",
+        "r/1": b"<script>alert(1)</script>",
+    }, {
+        "r/0": {"content_type": "image/png"},
+        "r/1": {"content_type": "text/html"},
+    })
+
+    response = client.get("/snapshots/page/index.html")
+    assert response.content == b"<p>hello</p>"
+    assert response.headers["content-type"] == "text/html; charset=utf-8"
+    assert "script-src 'none'" in response.headers["content-security-policy"]
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+    assert client.get("/snapshots/page/").content == b"<p>hello</p>"
+
+    response = client.get("/snapshots/page/r/0")
+    assert response.content == b"\x89PNG data"
+    assert response.headers["content-type"] == "image/png"
+
+    # Resources can never be served as HTML
+    response = client.get("/snapshots/page/r/1")
+    assert response.headers["content-type"] == "application/octet-stream"
+
+    assert client.get("/snapshots/page/index.json").status_code == 404
+    assert client.get("/snapshots/page/r/9").status_code == 404
+    assert client.get("/snapshots/missing/index.html").status_code == 404
+
+
+def test_serve_snapshot_picks_up_replaced_file(snapshot_dir, client, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_CACHE_SIZE", 1)
+    make_snapshot(snapshot_dir, "a", {"index.html": b"old"})
+    make_snapshot(snapshot_dir, "b", {"index.html": b"b"})
+
+    assert client.get("/snapshots/a/").content == b"old"
+    assert client.get("/snapshots/b/").content == b"b"
+    assert list(main._snapshot_cache) == ["b"]
+
+    make_snapshot(snapshot_dir, "b", {"index.html": b"new"})
+    assert client.get("/snapshots/b/").content == b"new"
+
+    os.remove(os.path.join(snapshot_dir, "b.zip"))
+    assert client.get("/snapshots/b/").status_code == 404
+    assert main._snapshot_cache == {}
+
+
+def test_serve_snapshot_rejects_bad_index(snapshot_dir, client):
+    with open(os.path.join(snapshot_dir, "bad.zip"), 'wb') as archive_file:
+        archive_file.write(make_upload({"index.json": "[]", "index.html": "x"}, zipfile.ZIP_STORED))
+
+    assert client.get("/snapshots/bad/").status_code == 500
+    assert "bad" not in main._snapshot_cache
+
+
+def test_download_snapshot(snapshot_dir, client):
+    make_snapshot(snapshot_dir, "page", {"index.html": b"<p>hello</p>"})
+
+    response = client.get("/snapshots/page/archive")
+    assert response.headers["content-type"] == "application/zip"
+    with open(os.path.join(snapshot_dir, "page.zip"), 'rb') as archive_file:
+        assert response.content == archive_file.read()
+
+
+def test_import_snapshot_sanitizes(client):
+    index = {"url": "https://example.com/", "resources": {"r/0": {"content_type": "text/html"}}}
+    upload = make_upload({
+        "index.json": json.dumps(index),
+        "index.html": '<html><head><base href="https://example.com/"><style>p{}</style></head>'
+                      '<body><script>alert(1)</script><img src="r/0"></body></html>',
+        "r/0": "<script>alert(1)</script>",
+    })
+
+    response = client.post("/snapshots/import?name=page", files={"file": ("page.zip", upload)})
+    assert response.status_code == 200
+
+    html = client.get("/snapshots/page/").text
+    assert "<script>" not in html
+    assert "<base" not in html
+    assert html.count("<style>") == 1
+    assert 'src="r/0"' in html
+    assert client.get("/snapshots/page/r/0").headers["content-type"] == "application/octet-stream"
+
+
+def test_import_snapshot_conflict(client):
+    upload = make_upload({"index.json": "{}", "index.html": "first"})
+    assert client.post("/snapshots/import", files={"file": ("page.zip", upload)}).status_code == 200
+
+    upload = make_upload({"index.json": "{}", "index.html": "second"})
+    assert client.post("/snapshots/import", files={"file": ("page.zip", upload)}).status_code == 409
+    assert client.get("/snapshots/page/").text == "first"
+
+    response = client.post("/snapshots/import?overwrite=true", files={"file": ("page.zip", upload)})
+    assert response.status_code == 200
+    assert client.get("/snapshots/page/").text == "second"
+
+
+@pytest.mark.parametrize("files", [
+    {"index.json": "{}", "index.html": "x", "../evil": "x"},
+    {"index.json": "[]", "index.html": "x"},
+    {"index.json": '{"resources": {"r/0": "text/css"}}', "index.html": "x"},
+    {"index.json": "{}"},
+])
+def test_import_snapshot_rejects_invalid_archive(client, files):
+    response = client.post("/snapshots/import?name=page", files={"file": ("page.zip", make_upload(files))})
+    assert response.status_code == 400
+    assert client.get("/snapshots").json() == {"snapshots": []}
+
+
+def test_import_snapshot_size_limits(client, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_MAX_ARCHIVE_BYTES", 10000)
+
+    # Compresses well below the upload limit, but expands past it
+    upload = make_upload({"index.json": "{}", "index.html": "x", "r/0": b"\0" * 20000})
+    assert len(upload) < 10000
+    response = client.post("/snapshots/import?name=page", files={"file": ("page.zip", upload)})
+    assert response.status_code == 400
+
+    upload = make_upload({"index.json": "{}", "index.html": os.urandom(20000)}, zipfile.ZIP_STORED)
+    response = client.post("/snapshots/import?name=page", files={"file": ("page.zip", upload)})
+    assert response.status_code == 413
+
+
+def test_export_snapshot(client, monkeypatch):
+    pages = {
+        "https://example.com/blog/post": (
+            "text/html",
+            '<html><head><base href="https://example.com/assets/">'
+            '<link rel="stylesheet" href="site.css"></head>'
+            '<body><img src="a.png" srcset="a.png 1x, data:image/png;base64,AA,BB 2x, b.png 3x">'
+            '<script>alert(1)</script></body></html>',
+        ),
+        "https://example.com/assets/site.css": (
+            "text/css",
+            '@import "extra.css"; body { background: url(img/bg.png) }',
+        ),
+        "https://example.com/assets/extra.css": ("text/css", "p { color: red }"),
+        "https://example.com/assets/a.png": ("image/png", "A"),
+        "https://example.com/assets/b.png": ("image/png", "B"),
+        "https://example.com/assets/img/bg.png": ("image/png", "BG"),
+    }
+
+    def handler(request):
+        if str(request.url) not in pages:
+            return httpx.Response(404)
+        content_type, body = pages[str(request.url)]
+        return httpx.Response(200, headers={"content-type": content_type}, text=body)
+
+    async def get_http_client():
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr(main, "get_http_client", get_http_client)
+
+    response = client.post("/snapshots/export?url=https://example.com/blog/post&name=post")
+    assert response.status_code == 200
+    assert client.post("/snapshots/export?url=https://example.com/blog/post&name=post").status_code == 409
+
+    snapshot = main.load_snapshot("post")
+    urls = {meta["url"]: path for path, meta in snapshot["index"]["resources"].items()}
+    assert set(urls) == set(pages)
+
+    html = client.get("/snapshots/post/").text
+    assert "<base" not in html
+    assert "<script>" not in html
+    assert f'src="{urls["https://example.com/assets/a.png"]}"' in html
+    assert f'href="{urls["https://example.com/assets/site.css"]}"' in html
+    assert "data:image/png;base64,AA,BB 2x" in html
+    assert f'{urls["https://example.com/assets/b.png"]} 3x' in html
+
+    css_path = urls["https://example.com/assets/site.css"]
+    css = client.get(f"/snapshots/post/{css_path}").text
+    assert f'@import "{urls["https://example.com/assets/extra.css"][len("r/"):]}"' in css
+    assert f'url({urls["https://example.com/assets/img/bg.png"][len("r/"):]})' in css
+
+
+def test_snapshot_name_for_url_includes_query():
+    assert main.snapshot_name_for_url("https://example.com/a?page=1") != \
+        main.snapshot_name_for_url("https://example.com/a?page=2")
+
+
+def test_rewrite_css_urls():
+    css = (
+        '@import "base.css"; @import url(\'theme.css\');'
+        ' body { background: url(img/bg.png) }'
+        ' @font-face { src: url("/f.woff2"), url(data:font/woff;base64,AA) }'
+        ' a { mask: url(#m) }'
+    )
+    seen = []
+
+    def replace(url, is_css):
+        seen.append((url, is_css))
+        return "LOCAL"
+
+    rewritten = main.rewrite_css_urls(css, "https://example.com/css/main.css", replace)
+    assert seen == [
+        ("https://example.com/css/base.css", True),
+        ("https://example.com/css/theme.css", True),
+        ("https://example.com/css/img/bg.png", False),
+        ("https://example.com/f.woff2", False),
+    ]
+    assert rewritten == (
+        '@import "LOCAL"; @import url(\'LOCAL\');'
+        ' body { background: url(LOCAL) }'
+        ' @font-face { src: url("LOCAL"), url(data:font/woff;base64,AA) }'
+        ' a { mask: url(#m) }'
+    )
+
+
+def test_parse_srcset():
+    assert main.parse_srcset("a.png 1x,b.png 2x") == [("a.png", "1x"), ("b.png", "2x")]
+    assert main.parse_srcset("data:image/png;base64,AA,BB 1x, c.png 2x") == [
+        ("data:image/png;base64,AA,BB", "1x"),
+        ("c.png", "2x"),
+    ]
+    assert main.parse_srcset("a.png, b.png 2x") == [("a.png", ""), ("b.png", "2x")]